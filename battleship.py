@@ -9,9 +9,10 @@ Contains core data structures and logic for Battleship, including:
 """
 
 import random
+import selectors
 import threading
-import queue
-from crypto_utils import decrypt_message
+import numpy as np
+from protocol import send_packet, send_packets, recv_packet, prepare_message, NO_SEQ
 
 BOARD_SIZE = 10
 SHIPS = [
@@ -22,6 +23,52 @@ SHIPS = [
     ("Destroyer", 2)
 ]
 TIMEOUT = 30 # seconds 
+CHECKPOINT_EVERY = 5 # turns between saved game states when no ship has been sunk
+# poll() suits the one or two sockets we wait on: no epoll instance or epoll_ctl per wait
+Selector = getattr(selectors, 'PollSelector', selectors.DefaultSelector)
+
+# Cell values stored in the uint8 board arrays (the ASCII code of the symbol shown)
+EMPTY = ord('.')
+SHIP = ord('S')
+HIT = ord('X')
+MISS = ord('o')
+
+# Fixed in-game messages, encrypted and checksummed once rather than on every turn
+YOUR_TURN = prepare_message("It's your turn! Enter a coordinate to fire at (e.g., B5):")
+TIMES_UP = prepare_message("Time's up! You took too long to respond.\n")
+NO_INPUT = prepare_message("No input received. Please enter a coordinate like B5.")
+ALREADY_SHOT = prepare_message("You've already fired at that location. Try again.")
+YOU_FORFEITED = prepare_message("\nYou forfeited the game.")
+OPPONENT_FORFEITED = prepare_message("\nOpponent forfeited. You win!")
+YOU_LOSE = prepare_message("All your ships are sunk. You lose.")
+
+
+def column_header(size):
+    """
+    Build the column header line (1 .. size) printed above a board. Each number is
+    right-aligned in a 2-wide slot, so its last digit sits over its cell in the rows below.
+    """
+    return "  " + "".join(str(i + 1).rjust(2) for i in range(size))
+
+
+# Board labels only depend on the board size, so build them once at import
+COL_NUMS = [str(i + 1).rjust(2) for i in range(BOARD_SIZE)]  # ' 1' .. '10'
+COL_HEADER = "  " + "".join(COL_NUMS)
+ROW_LABELS = [f"{chr(ord('A') + r):2}" for r in range(26)]  # 'A ' .. 'Z ', padded to the label width
+
+
+def ship_masks(size):
+    """
+    Build the bitmasks of a ship of each length 0 .. size anchored at cell (0, 0) on a
+    board of the given size (bit r * size + c per cell): one list for horizontal ships
+    and one for vertical ones. Shifting a mask by row * size + col moves it to (row, col).
+    """
+    h_masks = [(1 << n) - 1 for n in range(size + 1)]
+    v_masks = [sum(1 << (i * size) for i in range(n)) for n in range(size + 1)]
+    return h_masks, v_masks
+
+
+H_MASKS, V_MASKS = ship_masks(BOARD_SIZE)
 
 class Board:
     """
@@ -29,10 +76,11 @@ class Board:
     We store:
       - self.hidden_grid: tracks real positions of ships ('S'), hits ('X'), misses ('o')
       - self.display_grid: the version we show to the player ('.' for unknown, 'X' for hits, 'o' for misses)
+      Both grids are (size x size) NumPy uint8 arrays holding the ASCII code of each cell's symbol.
       - self.placed_ships: a list of dicts, each dict with:
           {
              'name': <ship_name>,
-             'positions': set of (r, c),
+             'mask': int bitmask of the ship's un-hit cells (bit r*size + c),
           }
         used to determine when a specific ship has been fully sunk.
 
@@ -45,10 +93,26 @@ class Board:
     def __init__(self, size=BOARD_SIZE):
         self.size = size
         # '.' for empty water
-        self.hidden_grid = [['.' for _ in range(size)] for _ in range(size)]
+        self.hidden_grid = np.full((size, size), EMPTY, dtype=np.uint8)
         # display_grid is what the player or an observer sees (no 'S')
-        self.display_grid = [['.' for _ in range(size)] for _ in range(size)]
-        self.placed_ships = []  # e.g. [{'name': 'Destroyer', 'positions': {(r, c), ...}}, ...]
+        self.display_grid = np.full((size, size), EMPTY, dtype=np.uint8)
+        # display_grid pre-rendered as text: one bytearray per row with the cells already
+        # space-separated, so cell (r, c) is byte 2 * c of display_rows[r]
+        self.display_rows = [bytearray(b" ".join([b"."] * size)) for _ in range(size)]
+        self.placed_ships = []  # e.g. [{'name': 'Destroyer', 'mask': 0b11}, ...]
+        self.remaining_ships = 0  # ships placed and not yet sunk
+        # Flat reverse index: cell_to_ship[r * size + c] is the ship dict covering (r, c), or None
+        self.cell_to_ship = [None] * (size * size)
+        # Bumped by fire_at whenever display_grid changes; the rendered text is cached per version
+        self.render_version = 0
+        self._rendered = ''
+        self._rendered_version = -1
+        self._grid_payload = b''
+        self._grid_payload_version = -1
+        self.col_header = COL_HEADER if size == BOARD_SIZE else column_header(size)
+        # Bitboard of every cell covered by a ship (bit r * size + c), used for placement checks
+        self.occupancy = 0
+        self.h_masks, self.v_masks = (H_MASKS, V_MASKS) if size == BOARD_SIZE else ship_masks(size)
 
     def place_ships_randomly(self, ships=SHIPS):
         """
@@ -56,21 +120,23 @@ class Board:
         In a networked version, you might parse explicit placements from a player's commands
         (e.g. "PLACE A1 H BATTLESHIP") or prompt the user for board coordinates and placement orientations; 
         the self.place_ships_manually() can be used as a guide.
+
+        Rather than retrying random spots until one fits, every in-bounds anchor
+        (row, col, orientation) for the ship is enumerated and shuffled, and the first
+        free one is taken - so placement always terminates.
         """
         for ship_name, ship_size in ships:
-            placed = False
-            while not placed:
-                orientation = random.randint(0, 1)  # 0 => horizontal, 1 => vertical
-                row = random.randint(0, self.size - 1)
-                col = random.randint(0, self.size - 1)
+            span = self.size - ship_size + 1
+            candidates = [(r, c, 0) for r in range(self.size) for c in range(span)]  # 0 => horizontal
+            candidates += [(r, c, 1) for r in range(span) for c in range(self.size)]  # 1 => vertical
+            random.shuffle(candidates)
 
+            for row, col, orientation in candidates:
                 if self.can_place_ship(row, col, ship_size, orientation):
-                    occupied_positions = self.do_place_ship(row, col, ship_size, orientation)
-                    self.placed_ships.append({
-                        'name': ship_name,
-                        'positions': occupied_positions
-                    })
-                    placed = True
+                    self._add_ship(ship_name, row, col, ship_size, orientation)
+                    break
+            else:
+                raise ValueError(f"No room left on the board to place the {ship_name}.")
 
 
     def place_ships_manually(self, ships=SHIPS):
@@ -103,11 +169,7 @@ class Board:
 
                 # Check if we can place the ship
                 if self.can_place_ship(row, col, ship_size, orientation):
-                    occupied_positions = self.do_place_ship(row, col, ship_size, orientation)
-                    self.placed_ships.append({
-                        'name': ship_name,
-                        'positions': occupied_positions
-                    })
+                    self._add_ship(ship_name, row, col, ship_size, orientation)
                     break
                 else:
                     print(f"  [!] Cannot place {ship_name} at {coord_str} (orientation={orientation_str}). Try again.")
@@ -122,32 +184,48 @@ class Board:
         if orientation == 0:  # Horizontal
             if col + ship_size > self.size:
                 return False
-            for c in range(col, col + ship_size):
-                if self.hidden_grid[row][c] != '.':
-                    return False
         else:  # Vertical
             if row + ship_size > self.size:
                 return False
-            for r in range(row, row + ship_size):
-                if self.hidden_grid[r][col] != '.':
-                    return False
-        return True
+        return (self.occupancy & self._ship_mask(row, col, ship_size, orientation)) == 0
+
+    def _ship_mask(self, row, col, ship_size, orientation):
+        """
+        Bitmask of the cells a ship of length 'ship_size' at (row, col) would cover.
+        """
+        masks = self.h_masks if orientation == 0 else self.v_masks
+        return masks[ship_size] << (row * self.size + col)
 
     def do_place_ship(self, row, col, ship_size, orientation):
         """
-        Place the ship on hidden_grid by marking 'S', and return the set of occupied positions.
+        Place the ship on hidden_grid by marking 'S', and return a bitmask of the occupied
+        positions (bit r * size + c is set for each cell the ship covers).
         """
-        occupied = set()
         if orientation == 0:  # Horizontal
-            for c in range(col, col + ship_size):
-                self.hidden_grid[row][c] = 'S'
-                occupied.add((row, c))
+            self.hidden_grid[row, col:col + ship_size] = SHIP
         else:  # Vertical
-            for r in range(row, row + ship_size):
-                self.hidden_grid[r][col] = 'S'
-                occupied.add((r, col))
+            self.hidden_grid[row:row + ship_size, col] = SHIP
+        occupied = self._ship_mask(row, col, ship_size, orientation)
+        self.occupancy |= occupied
         return occupied
 
+    def _add_ship(self, ship_name, row, col, ship_size, orientation):
+        """
+        Place a ship (already checked with can_place_ship), record it in placed_ships
+        and point every cell it covers at it in cell_to_ship.
+        """
+        ship = {
+            'name': ship_name,
+            'mask': self.do_place_ship(row, col, ship_size, orientation)
+        }
+        self.placed_ships.append(ship)
+        self.remaining_ships += 1
+
+        start = row * self.size + col
+        step = 1 if orientation == 0 else self.size
+        self.cell_to_ship[start:start + ship_size * step:step] = [ship] * ship_size
+        return ship
+
     def fire_at(self, row, col):
         """
         Fire at (row, col). Return a tuple (result, sunk_ship_name).
@@ -159,23 +237,27 @@ class Board:
 
         The server can use this result to inform the firing player.
         """
-        cell = self.hidden_grid[row][col]
-        if cell == 'S':
+        cell = self.hidden_grid[row, col]
+        if cell == SHIP:
             # Mark a hit
-            self.hidden_grid[row][col] = 'X'
-            self.display_grid[row][col] = 'X'
+            self.hidden_grid[row, col] = HIT
+            self.display_grid[row, col] = HIT
+            self.display_rows[row][2 * col] = HIT
+            self.render_version += 1
             # Check if that hit sank a ship
             sunk_ship_name = self._mark_hit_and_check_sunk(row, col)
             if sunk_ship_name:
                 return ('hit', sunk_ship_name)  # A ship has just been sunk
             else:
                 return ('hit', None)
-        elif cell == '.':
+        elif cell == EMPTY:
             # Mark a miss
-            self.hidden_grid[row][col] = 'o'
-            self.display_grid[row][col] = 'o'
+            self.hidden_grid[row, col] = MISS
+            self.display_grid[row, col] = MISS
+            self.display_rows[row][2 * col] = MISS
+            self.render_version += 1
             return ('miss', None)
-        elif cell == 'X' or cell == 'o':
+        elif cell == HIT or cell == MISS:
             return ('already_shot', None)
         else:
             # In principle, this branch shouldn't happen if 'S', '.', 'X', 'o' are all possibilities
@@ -183,26 +265,25 @@ class Board:
 
     def _mark_hit_and_check_sunk(self, row, col):
         """
-        Remove (row, col) from the relevant ship's positions.
-        If that ship's positions become empty, return the ship name (it's sunk).
+        Clear the bit for (row, col) from the mask of the ship covering that cell.
+        If that ship's mask becomes zero, return the ship name (it's sunk).
         Otherwise return None.
         """
-        for ship in self.placed_ships:
-            if (row, col) in ship['positions']:
-                ship['positions'].remove((row, col))
-                if len(ship['positions']) == 0:
-                    return ship['name']
-                break
+        idx = row * self.size + col
+        ship = self.cell_to_ship[idx]
+        if ship is None:
+            return None
+        ship['mask'] &= ~(1 << idx)
+        if ship['mask'] == 0:
+            self.remaining_ships -= 1
+            return ship['name']
         return None
 
     def all_ships_sunk(self):
         """
-        Check if all ships are sunk (i.e. every ship's positions are empty).
+        Check if all ships are sunk (i.e. no ship is left afloat).
         """
-        for ship in self.placed_ships:
-            if len(ship['positions']) > 0:
-                return False
-        return True
+        return self.remaining_ships == 0
 
     def print_display_grid(self, show_hidden_board=False):
         """
@@ -219,30 +300,71 @@ class Board:
         - 'o' for misses,
         - '.' for empty water.
         """
-        # Decide which grid to print
-        grid_to_print = self.hidden_grid if show_hidden_board else self.display_grid
-
         # Column headers (1 .. N)
-        print("  " + "".join(str(i + 1).rjust(2) for i in range(self.size)))
+        print(self.col_header)
         # Each row labeled with A, B, C, ...
-        for r in range(self.size):
-            row_label = chr(ord('A') + r)
-            row_str = " ".join(grid_to_print[r][c] for c in range(self.size))
-            print(f"{row_label:2} {row_str}")
+        if show_hidden_board:
+            print(self._render_rows(self.hidden_grid), end="")
+        else:
+            print(self.render_display(), end="")
+
+    def render_display(self):
+        """
+        Return the labelled rows of display_grid as one string (a line per row).
+        The text is cached and only rebuilt once render_version has moved on, so an
+        unchanged board (e.g. the one nobody fired at this turn) is never re-rendered.
+        """
+        if self._rendered_version != self.render_version:
+            self._rendered = "".join(
+                ROW_LABELS[r] + " " + self.display_rows[r].decode('ascii') + "\n"
+                for r in range(self.size)
+            )
+            self._rendered_version = self.render_version
+        return self._rendered
+
+    def grid_payload(self):
+        """
+        Return the board as the bytes of a GRID packet: a "GRID" line, the column header and
+        the rows. Cached like render_display, so resending an unchanged board encodes nothing.
+        """
+        if self._grid_payload_version != self.render_version:
+            self._grid_payload = f"GRID\n{self.col_header}\n{self.render_display()}".encode('ascii')
+            self._grid_payload_version = self.render_version
+        return self._grid_payload
+
+    def _render_rows(self, grid):
+        """
+        Render every row of 'grid' as "<label> <cells separated by spaces>\n".
+        """
+        return "".join(
+            ROW_LABELS[r] + " " + " ".join(grid[r].tobytes().decode('ascii')) + "\n"
+            for r in range(self.size)
+        )
 
 
 def parse_coordinate(coord_str):
     """
     Convert something like 'B5' into zero-based (row, col).
     Example: 'A1' => (0, 0), 'C10' => (2, 9)
-    HINT: you might want to add additional input validation here...
-    """
-    coord_str = coord_str.strip().upper()
-    row_letter = coord_str[0]
-    col_digits = coord_str[1:]
+    Raises ValueError if the text is not a letter followed by digits, or is off the board.
 
-    row = ord(row_letter) - ord('A')
-    col = int(col_digits) - 1  # zero-based
+    Works on the ASCII codes directly rather than slicing/upper-casing/int()-ing strings.
+    """
+    data = coord_str.strip().encode()
+    if len(data) < 2:
+        raise ValueError("expected a row letter followed by a column number (e.g. B5)")
+
+    row = (data[0] & 0x5F) - 0x41  # clearing bit 0x20 upper-cases an ASCII letter; 0x41 == 'A'
+    col = 0
+    for code in data[1:]:
+        digit = code - 0x30  # 0x30 == '0'
+        if not 0 <= digit <= 9:
+            raise ValueError("expected a row letter followed by a column number (e.g. B5)")
+        col = col * 10 + digit
+    col -= 1  # zero-based
+
+    if not (0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE):
+        raise ValueError(f"{coord_str.strip()} is off the board")
 
     return (row, col)
 
@@ -257,9 +379,9 @@ def run_single_player_game_locally():
     """
 
     def timed_input(prompt):
+        result = [None]  # filled in by the reader thread; local to this call, not a module global
         def get_input():
-            global user_input
-            user_input = input(prompt)
+            result[0] = input(prompt)
 
         thread = threading.Thread(target=get_input, daemon=True)
         thread.start()
@@ -268,7 +390,7 @@ def run_single_player_game_locally():
         if thread.is_alive():
             return None # timout reached
         else: 
-            return user_input
+            return result[0]
 
     board = Board(BOARD_SIZE)
 
@@ -318,12 +440,12 @@ def run_single_player_game_locally():
             print("  >> Invalid input:", e)
 
 
-def run_single_player_game_online(rfile, wfile):
+def run_single_player_game_online(rfile, conn):
     """
     A test harness for running the single-player game with I/O redirected to socket file objects.
     Expects:
-      - rfile: file-like object to .readline() from client
-      - wfile: file-like object to .write() back to client
+      - rfile: FrameReader to read packets from the client
+      - conn: the client's socket, which packets are sent back on
     
     #####
     NOTE: This function is (intentionally) currently somewhat "broken", which will be evident if you try and play the game via server/client.
@@ -331,21 +453,14 @@ def run_single_player_game_online(rfile, wfile):
     #####
     """
     def send(msg):
-        wfile.write(msg + '\n')
-        wfile.flush()
+        send_packet(conn, NO_SEQ, msg)
 
     def send_board(board):
-        wfile.write("GRID\n")
-        wfile.write("  " + " ".join(str(i + 1).rjust(2) for i in range(board.size)) + '\n')
-        for r in range(board.size):
-            row_label = chr(ord('A') + r)
-            row_str = " ".join(board.display_grid[r][c] for c in range(board.size))
-            wfile.write(f"{row_label:2} {row_str}\n")
-        wfile.write('\n')
-        wfile.flush()
+        send_packet(conn, NO_SEQ, board.grid_payload())
 
     def recv():
-        return rfile.readline().strip()
+        packet = recv_packet(rfile)
+        return packet[1].strip() if packet else ''
 
     board = Board(BOARD_SIZE)
     board.place_ships_randomly(SHIPS) 
@@ -382,68 +497,70 @@ def run_single_player_game_online(rfile, wfile):
         except ValueError as e:
             send(f"Invalid input: {e}")
 
-def send(wfile, msg):
-    wfile.write(msg + '\n')
-    wfile.flush()
+def send(conn, msg):
+    send_packet(conn, NO_SEQ, msg)
 
 def recv(rfile):
-    return rfile.readline().strip()
-
-def send_board(wfile, board):
-    wfile.write("GRID\n")
-    wfile.write("  " + " ".join(str(i + 1).rjust(2) for i in range(board.size)) + '\n')
-    for r in range(board.size):
-        row_label = chr(ord('A') + r)
-        row_str = " ".join(board.display_grid[r][c] for c in range(board.size))
-        wfile.write(f"{row_label:2} {row_str}\n")
-    wfile.write('\n')
-    wfile.flush()
+    packet = recv_packet(rfile)
+    return packet[1].strip() if packet else ''
+
+def send_board(conn, board):
+    """
+    Send the board as one packet: a "GRID" line, then the column header and the rows.
+    """
+    send_packet(conn, NO_SEQ, board.grid_payload())
+
+def send_with_board(conn, msg, board):
+    """
+    Send a message followed by the board in one write.
+    """
+    send_packets(conn, NO_SEQ, (msg, board.grid_payload()))
 
 def timed_input(rfile, timeout=TIMEOUT):
-    result = {}
-    def worker():
-        try:
-            raw_data = rfile.readline().strip()
-            encrypted_msg = raw_data.split('|')[1]
-            decrypted_msg = decrypt_message(encrypted_msg)
-            result['data'] = decrypted_msg
-        except Exception:
-            result['data'] = None
-
-    thread = threading.Thread(target=worker, daemon=True)
-    thread.start()
-    thread.join(timeout)
-
-    if thread.is_alive():
-        return None # timeout reaches
-    else:
-        return result.get('data', None)
+    """
+    Wait up to 'timeout' seconds for the client to send a message, then decrypt and return it.
+    Returns None on timeout or if the message could not be read/decrypted.
+
+    The wait is a selector on the socket rather than a reader thread, so nothing is left
+    behind reading (and swallowing) the next message once the timeout expires. A selector is
+    created per call since several game threads may be waiting at the same time. A frame the
+    reader has already buffered is returned without waiting, as the socket won't signal it.
+    """
+    if not rfile.has_frame():
+        with Selector() as sel:
+            sel.register(rfile, selectors.EVENT_READ)
+            if not sel.select(timeout):
+                return None # timeout reached
+
+    try:
+        packet = recv_packet(rfile)
+    except OSError:
+        return None
+    return packet[1] if packet else None
 
 def broadcast_game_state_to_spectators(players, message, broadcast_callback):
     """
     Broadcast the current game state to all spectators.
+    The text is rendered and UTF-8 encoded once here and broadcast_callback receives the
+    same bytes object for every spectator, so nothing downstream needs to re-serialize it.
     """
-    game_state = []
-    for p in players:
-        board_state = f"{p['name']}'s Board:\n"
-        board_state += "  " + " ".join(str(i + 1).rjust(2) for i in range(p["board"].size)) + '\n'
-        for r in range(p["board"].size):
-            row_label = chr(ord('A') + r)
-            row_str = " ".join(p["board"].display_grid[r][c] for c in range(p["board"].size))
-            board_state += f"{row_label:2} {row_str}\n"
-        game_state.append(board_state)
+    parts = [message, "\n\n"]
+    for i, p in enumerate(players):
+        if i:
+            parts.append("\n\n")
+        parts += (p['name'], "'s Board:\n", p["board"].col_header, "\n", p["board"].render_display())
     
-    full_message = f"{message}\n\n" + "\n\n".join(game_state)
+    full_message = "".join(parts).encode('utf-8')
     broadcast_callback(full_message)
 
 def run_two_player_game_online(player1_io, player2_io, broadcast_callback, save_state_callback, player1_id, player2_id, initial_state=None):
     """
     Runs a turn-based Battleship game between two online players.
-    Each player_io is a tuple of (rfile, wfile) file-like objects.
+    Each player_io is a tuple of (rfile, conn): a FrameReader and the socket to send on.
     """
 
-    rfile1, wfile1 = player1_io
-    rfile2, wfile2 = player2_io
+    rfile1, conn1 = player1_io
+    rfile2, conn2 = player2_io
 
     if initial_state:
         board1 = initial_state['board1']    
@@ -463,8 +580,8 @@ def run_two_player_game_online(player1_io, player2_io, broadcast_callback, save_
         moves = [0, 0]  # Track moves per player
 
     players = [
-        {"name": "Player 1", "r": rfile1, "w": wfile1, "board": board2}, # Fires at player 2’s board
-        {"name": "Player 2", "r": rfile2, "w": wfile2, "board": board1} # Fires at player 1’s board
+        {"name": "Player 1", "r": rfile1, "w": conn1, "board": board2}, # Fires at player 2’s board
+        {"name": "Player 2", "r": rfile2, "w": conn2, "board": board1} # Fires at player 1’s board
     ]
 
     if not initial_state:
@@ -472,105 +589,96 @@ def run_two_player_game_online(player1_io, player2_io, broadcast_callback, save_
             send(p["w"], f"Welcome {p['name']}! Game is starting now. Type 'quit' to exit.\n")
         broadcast_game_state_to_spectators(players, "Game started. Here are the initial boards:", broadcast_callback)
 
-    while True: # Outer loop: Manages the game flow
-        p = players[current]
-        opponent = players[1 - current]
-
-        send(p["w"], "It's your turn! Enter a coordinate to fire at (e.g., B5):")
-        send(opponent["w"], f"Waiting for {p['name']} to take their turn...")
-
-        send_board(p["w"], p["board"])
-
-        while True: # Inner loop: Handles input and game logic
-            guess = timed_input(p["r"])
+    def checkpoint(turn):
+        save_state_callback(player1_id, player2_id, {
+            'board1': board1,
+            'board2': board2,
+            'turn': turn,
+            'moves': {'Player 1': moves[0], 'Player 2': moves[1]}
+        })
+
+    turns_since_save = 0
+    try:
+        while True: # Outer loop: Manages the game flow
+            p = players[current]
+            opponent = players[1 - current]
+
+            send_with_board(p["w"], YOUR_TURN, p["board"]) # the prompt and the board leave together
+            send(opponent["w"], f"Waiting for {p['name']} to take their turn...")
+
+            sunk_this_turn = False
+            while True: # Inner loop: Handles input and game logic
+                guess = timed_input(p["r"])
             
-            if guess is None:
-                send(p["w"], "Time's up! You took too long to respond.\n")
-                send(opponent["w"], f"{p['name']} took too long.\n")
-                broadcast_game_state_to_spectators(players, f"{p['name']} took too long. Turn forfeited.", broadcast_callback)
-                break  # forfeit turn
+                if guess is None:
+                    send(p["w"], TIMES_UP)
+                    send(opponent["w"], f"{p['name']} took too long.\n")
+                    broadcast_game_state_to_spectators(players, f"{p['name']} took too long. Turn forfeited.", broadcast_callback)
+                    break  # forfeit turn
             
-            if not guess:
-                send(p["w"], "No input received. Please enter a coordinate like B5.")
-                continue
+                if not guess:
+                    send(p["w"], NO_INPUT)
+                    continue
 
-            if guess.lower() == 'quit':
-                send(p["w"], "\nYou forfeited the game.")
-                send(opponent["w"], "\nOpponent forfeited. You win!")
-                
-                # Send final boards to both players
-                send_board(p["w"], p["board"])
-                send_board(opponent["w"], opponent["board"])
-
-                broadcast_game_state_to_spectators(players, "Game over. A player forfeited.", broadcast_callback)
-
-                game_data = {
-                    'board1': p["board"],  # Player 1's board
-                    'board2': opponent["board"],  # Player 2's board
-                    'turn': current,  # Current player turn
-                    'moves': moves  # Moves count
-                }
-
-                return
-            try:
-                row, col = parse_coordinate(guess)
-                result, sunk_name = p["board"].fire_at(row, col)
-                moves[current] += 1
-
-                if result == 'hit':
-                    if sunk_name:
-                        hit_message = f"HIT! {p['name']} sank the {sunk_name}!"
-                        send(p["w"], hit_message)
-                        send(opponent["w"], f"{p['name']} sank your {sunk_name}!")
-                    else:
-                        hit_message = "HIT!"
-                        send(p["w"], hit_message)
-                        send(opponent["w"], f"{p['name']} hit one of your ships!")
+                if guess.lower() == 'quit':
+                    # Send the result and final board to each player
+                    send_with_board(p["w"], YOU_FORFEITED, p["board"])
+                    send_with_board(opponent["w"], OPPONENT_FORFEITED, opponent["board"])
+
+                    broadcast_game_state_to_spectators(players, "Game over. A player forfeited.", broadcast_callback)
+                    return
+                try:
+                    row, col = parse_coordinate(guess)
+                    result, sunk_name = p["board"].fire_at(row, col)
+                    moves[current] += 1
+
+                    if result == 'hit':
+                        if sunk_name:
+                            hit_message = f"HIT! {p['name']} sank the {sunk_name}!"
+                            send(p["w"], hit_message)
+                            send(opponent["w"], f"{p['name']} sank your {sunk_name}!")
+                        else:
+                            hit_message = "HIT!"
+                            send(p["w"], hit_message)
+                            send(opponent["w"], f"{p['name']} hit one of your ships!")
                     
-                    broadcast_game_state_to_spectators(players, hit_message, broadcast_callback)
-
-                    if p["board"].all_ships_sunk():
-                        send(p["w"], f"Congratulations! You sank all ships in {moves[current]} moves.")
-                        send(opponent["w"], "All your ships are sunk. You lose.")
-
-                        # Send final boards to both players
-                        send_board(p["w"], p["board"])
-                        send_board(opponent["w"], opponent["board"])
-
-                        broadcast_game_state_to_spectators(players, "Game over. All ships have been sunk!", broadcast_callback)
-                        
-                        game_data = {
-                            'board1': p["board"],  # Player 1's board
-                            'board2': opponent["board"],  # Player 2's board
-                            'turn': current,  # Current player turn
-                            'moves': moves  # Moves count
-                        }
-
-                        return # Ends the game if all ships are sunk
+                        broadcast_game_state_to_spectators(players, hit_message, broadcast_callback)
+
+                        sunk_this_turn = sunk_name is not None
+
+                        if p["board"].all_ships_sunk():
+                            # Send the result and final board to each player
+                            send_with_board(p["w"], f"Congratulations! You sank all ships in {moves[current]} moves.", p["board"])
+                            send_with_board(opponent["w"], YOU_LOSE, opponent["board"])
+
+                            broadcast_game_state_to_spectators(players, "Game over. All ships have been sunk!", broadcast_callback)
+                            return # Ends the game if all ships are sunk
                     
-                elif result == 'miss':
-                    miss_message = "MISS!"
-                    send(p["w"], miss_message)
-                    send(opponent["w"], f"{p['name']} missed.")
-                    broadcast_game_state_to_spectators(players, miss_message, broadcast_callback)
-
-                elif result == 'already_shot':
-                    send(p["w"], "You've already fired at that location. Try again.")
-                    continue # Lets the player try again
+                    elif result == 'miss':
+                        miss_message = "MISS!"
+                        send(p["w"], miss_message)
+                        send(opponent["w"], f"{p['name']} missed.")
+                        broadcast_game_state_to_spectators(players, miss_message, broadcast_callback)
+
+                    elif result == 'already_shot':
+                        send(p["w"], ALREADY_SHOT)
+                        continue # Lets the player try again
                 
-                break
-            except ValueError as e:
-                send(p["w"], f"Invalid input: {e}")
+                    break
+                except ValueError as e:
+                    send(p["w"], f"Invalid input: {e}")
         
-        game_data = {
-                    'board1': board1,
-                    'board2': board2,
-                    'turn': 1 - current,
-                    'moves': {'Player 1': moves[0], 'Player 2': moves[1]}
-                }
-        save_state_callback(player1_id, player2_id, game_data)
-    
-        current = 1 - current  # Switches turns after each valid shot
+            current = 1 - current  # Switches turns after each valid shot
+
+            # Checkpoint when a ship went down or every CHECKPOINT_EVERY turns, not after every shot
+            turns_since_save += 1
+            if sunk_this_turn or turns_since_save >= CHECKPOINT_EVERY:
+                checkpoint(current)
+                turns_since_save = 0
+    except OSError:
+        # A player's connection dropped mid-turn: save the exact turn so a reconnect resumes it
+        checkpoint(current)
+        raise
 
 def main():
     while True:
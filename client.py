@@ -6,49 +6,32 @@ Simply pipes user input to the server, and prints all server responses.
 """
 import socket
 import threading
-import zlib 
-from crypto_utils import decrypt_message, encrypt_message
+from protocol import send_packet, unpack_packet, FrameReader
 
 HOST = '127.0.0.1'
 PORT = 5000
 
-def generate_crc32_checksum(data):
-    return zlib.crc32(data) & 0xFFFFFFFF
-
-def verify_checksum(message, expected_checksum):
-    message_data, checksum_str = message.rsplit('|', 1) # message = data|checksum
-    checksum = int(checksum_str)
-    computed_checksum = generate_crc32_checksum(message_data.encode()) # generate checksum from message and compare with the received checksum
-    return checksum == computed_checksum
-
 
 def receive_messages(rfile, socket_obj, stop_event):
     try:
         while not stop_event.is_set():
-            line = rfile.readline()
-            if not line:
+            frame = rfile.recv_frame()
+            if frame is None:
                 print("[INFO] Server disconnected.")
                 stop_event.set()
                 break
 
-            line = line.strip()
+            packet = unpack_packet(frame)
+            if packet is None:
+                continue  # discard packets that fail the checksum
+            seq, message = packet
 
-            if line == "GRID":
-                # Begin reading board lines
+            if message.startswith("GRID\n"):
+                # The whole board arrives in the one packet after the GRID marker
                 print("\n[Board]")
-                while True:
-                    board_line = rfile.readline()
-                    if not board_line or board_line.strip() == "":
-                        break
-                    print(board_line.strip())
+                print(message[len("GRID\n"):].rstrip('\n'))
             else:
-                if '|' in line:
-                    seq, message_enc, _ = line.rsplit('|', 2)  # discard checksum
-                    # message shoudl be encrypted and therefore in the format (iv+ciphertext)
-                    message = decrypt_message(message_enc)
-                    print(message)
-                else:
-                    print(line)
+                print(message)
 
     except Exception as e:
         print(f"[ERROR] An error occurred in the receive thread: {e}")
@@ -57,7 +40,7 @@ def receive_messages(rfile, socket_obj, stop_event):
         socket_obj.close()
 
 
-def handle_user_input(wfile, stop_event):
+def handle_user_input(conn, stop_event):
     seq_num = 0
     try:
         while not stop_event.is_set():
@@ -65,15 +48,8 @@ def handle_user_input(wfile, stop_event):
             if stop_event.is_set():  # Exit if the server disconnects
                 break
             
-            # encrypt the user input before adding the checksum
-            encrypted_message = encrypt_message(user_input) # this is in bytes
-            message_with_seq = f"{seq_num}|{encrypted_message}"
-            
-            checksum = generate_crc32_checksum(message_with_seq.encode())
-            message = f"{message_with_seq}|{checksum}"
-
-            wfile.write(message + "\n") # writes the (iv + msg)|checksum packet to the wfile
-            wfile.flush()
+            # encrypts the user input and writes the seq|(iv + msg)|checksum packet as one frame
+            send_packet(conn, seq_num, user_input)
             
             seq_num +=1 
     except Exception as e:
@@ -85,12 +61,11 @@ def main():
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.connect((HOST, PORT))
-        rfile = s.makefile('r')
-        wfile = s.makefile('w')
+        rfile = FrameReader(s) # frames are read with recv_into, writes go straight to s.sendall
 
         threading.Thread(target=receive_messages, args=(rfile, s, stop_event), daemon=True).start()
 
-        threading.Thread(target=handle_user_input, args=(wfile, stop_event), daemon=True).start()
+        threading.Thread(target=handle_user_input, args=(s, stop_event), daemon=True).start()
 
         stop_event.wait()
 
@@ -1,30 +1,58 @@
 from Crypto.Cipher import AES
-from Crypto.Util import Counter
-from Crypto.Random import get_random_bytes
+from Crypto.Util.strxor import strxor
 import os
-import base64
+import threading
 
 # Shared secret key (32 bytes = 256-bit key)
 SECRET_KEY = b'ThisIsAStaticKeyForTesting123456'
+IV_SIZE = 16
+BLOCK_MASK = (1 << 128) - 1
 
-def encrypt_message(message: str) -> str:
-    iv = get_random_bytes(16)  # 128-bit IV
-    ctr = Counter.new(128, initial_value=int.from_bytes(iv, byteorder='big')) # new ctr each time as per AES CTR mode 
-    cipher = AES.new(SECRET_KEY, AES.MODE_CTR, counter=ctr)
-    ciphertext = cipher.encrypt(message.encode('utf-8'))
-    encrypted_data = iv + ciphertext
-    return base64.b64encode(encrypted_data).decode('utf-8') # message is a string
+# One ECB cipher per thread, built on first use; every later message on that thread reuses its
+# key schedule instead of paying for it in AES.new, and game threads never share cipher state
+_tls = threading.local()
 
-def decrypt_message(data: str) -> str:
-    # Ensure correct padding
-    missing_padding = len(data) % 4
-    if missing_padding != 0:
-        data += '=' * (4 - missing_padding)
-    
-    raw_data = base64.b64decode(data.encode('utf-8'))
-    iv = raw_data[:16]
-    ciphertext = raw_data[16:]
-    ctr = Counter.new(128, initial_value=int.from_bytes(iv, byteorder='big'))
-    cipher = AES.new(SECRET_KEY, AES.MODE_CTR, counter=ctr)
-    plaintext = cipher.decrypt(ciphertext).decode('utf-8')
+def _get_ecb():
+    ecb = getattr(_tls, 'ecb', None)
+    if ecb is None:
+        ecb = _tls.ecb = AES.new(SECRET_KEY, AES.MODE_ECB)
+    return ecb
+
+def _ctr_xor(iv: bytes, data, output=None) -> bytes:
+    # AES-CTR by hand: the 16-byte IV is the initial 128-bit counter block, incremented (mod 2^128)
+    # per block, so the stream is the same as the old Counter.new(128, initial_value=iv) cipher.
+    # All counter blocks go through this thread's cached ECB cipher in a single call.
+    n = len(data)
+    if n <= IV_SIZE:
+        # Fast path for the usual short command/reply: the IV itself is the only counter block
+        keystream = _get_ecb().encrypt(iv)
+    else:
+        start = int.from_bytes(iv, 'big')
+        counters = b''.join(((start + i) & BLOCK_MASK).to_bytes(16, 'big') for i in range(-(-n // 16)))
+        keystream = _get_ecb().encrypt(counters)
+    # with 'output' (a writable buffer of len(data) bytes) the result goes there and None is returned
+    return strxor(data, keystream[:n], output=output)
+
+def encrypt_message(message) -> bytes:
+    # message may be a str or already UTF-8 encoded bytes (e.g. a spectator broadcast)
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    iv = os.urandom(IV_SIZE)  # 128-bit IV from the OS CSPRNG, new for each message as per AES CTR mode
+    ciphertext = _ctr_xor(iv, message)
+    return iv + ciphertext # raw bytes, framed as-is
+
+def encrypt_into(message, out) -> int:
+    # Same as encrypt_message, but iv + ciphertext are written straight into the writable
+    # buffer 'out' (e.g. a slice of a send buffer) and the number of bytes written is returned.
+    # 'message' must already be UTF-8 bytes, so the caller knows the size to reserve.
+    end = IV_SIZE + len(message)
+    out[:IV_SIZE] = os.urandom(IV_SIZE)
+    _ctr_xor(out[:IV_SIZE], message, output=out[IV_SIZE:end])
+    return end
+
+def decrypt_message(data) -> str:
+    # data is iv + ciphertext as any bytes-like object (e.g. a memoryview into a packet)
+    iv = data[:IV_SIZE]
+    ciphertext = data[IV_SIZE:]
+    plaintext = _ctr_xor(iv, ciphertext).decode('utf-8')
     return plaintext
@@ -0,0 +1,283 @@
+"""
+protocol.py
+
+Message framing shared by the client, the server and the game logic.
+
+Every message on the wire is a 4-byte big-endian length followed by that many bytes, so a
+message can span several lines (e.g. a whole board) and the reader never has to scan for
+newlines or sentinel lines to find where it ends.
+
+The frame holds one binary packet:
+
+    seq (4-byte signed, -1 when there is none) | iv + ciphertext | crc32 (4 bytes)
+
+The checksum covers the IV and ciphertext followed by the sequence number, so it is computed
+over the body first and then continued (zlib.crc32's running value) over the small header.
+Everything stays raw bytes, so there is no base64 or text transcoding between the cipher and
+the socket.
+"""
+
+import socket
+import struct
+import threading
+from collections import namedtuple
+from crypto_utils import encrypt_message, encrypt_into, decrypt_message, IV_SIZE
+
+try:
+    # optional: the same CRC-32 (zlib's polynomial and chaining) behind a lighter binding
+    from fastcrc.crc32 import iso_hdlc as _crc32
+except ImportError:
+    from zlib import crc32 as _crc32
+
+LENGTH_PREFIX_SIZE = 4
+SEQ_SIZE = 4
+CRC_SIZE = 4
+NO_SEQ = -1  # seq sent with messages that don't acknowledge anything
+# Largest frame accepted from a peer. A board update is well under 1 KiB, so anything bigger
+# is a corrupt or hostile length prefix and is never buffered.
+MAX_FRAME_SIZE = 16 * 1024
+
+# Compiled once rather than re-parsing the format string on every pack/unpack
+_LENGTH = struct.Struct('!I')
+_SEQ = struct.Struct('!i')
+_CRC = struct.Struct('!I')
+_FRAME_HEADER = struct.Struct('!Ii')  # length prefix + seq, packed together when sending
+FRAME_HEADER_SIZE = _FRAME_HEADER.size
+
+# Each thread assembles outgoing frames in its own reusable buffer
+_tls = threading.local()
+
+
+def generate_crc32_checksum(data, value=0):
+    # 'value' continues a previous CRC, so a checksum can be built up piece by piece.
+    # Both bindings already return the unsigned 32-bit value, so no mask is needed.
+    return _crc32(data, value)
+
+
+def _send_buffer(size, keep=0):
+    """
+    Return this thread's frame buffer (as a memoryview), grown if it is smaller than 'size'.
+    The first 'keep' bytes are carried over when it grows.
+    """
+    view = getattr(_tls, 'view', None)
+    if view is None or len(view) < size:
+        grown = memoryview(bytearray(max(size, 2 * len(view) if view else 4096)))
+        if keep:
+            grown[:keep] = view[:keep]
+        view = _tls.view = grown
+    return view
+
+
+class FrameReader:
+    """
+    Reads length-prefixed frames straight off a socket.
+
+    Data is received with recv_into into one reusable bytearray, and frame boundaries come from
+    the length prefixes in that buffer, so there is no file object or line scanning in between.
+    """
+
+    def __init__(self, conn, size=8192):
+        self.conn = conn
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # first unread byte in buf
+        self.end = 0    # end of the received data in buf
+
+    def fileno(self):
+        # lets the reader be registered with a selector directly
+        return self.conn.fileno()
+
+    def has_frame(self):
+        """
+        True if a whole frame is already buffered, so the next recv_frame won't touch the socket.
+        Also True for an oversized length prefix, which recv_frame rejects without reading on.
+        """
+        available = self.end - self.start
+        if available < LENGTH_PREFIX_SIZE:
+            return False
+        (length,) = _LENGTH.unpack_from(self.buf, self.start)
+        return length > MAX_FRAME_SIZE or available >= LENGTH_PREFIX_SIZE + length
+
+    def _make_room(self, n):
+        """
+        Make sure n bytes from the first unread one fit in buf.
+        """
+        if self.start + n > len(self.buf):
+            # move the unread bytes to the front, growing the buffer for frames bigger than it
+            pending = self.end - self.start
+            if n > len(self.buf):
+                grown = bytearray(max(n, 2 * len(self.buf)))
+                grown[:pending] = self.view[self.start:self.end]
+                self.buf, self.view = grown, memoryview(grown)
+            else:
+                self.buf[:pending] = self.view[self.start:self.end]
+            self.start, self.end = 0, pending
+
+    def _fill(self, n):
+        """
+        Receive until at least n unread bytes are buffered.
+        Returns False if the connection closed first.
+        """
+        self._make_room(n)
+        while self.end - self.start < n:
+            received = self.conn.recv_into(self.view[self.end:])
+            if not received:
+                return False
+            self.end += received
+        return True
+
+    def feed(self):
+        """
+        Receive whatever the socket has ready with a single recv_into, without waiting for the
+        rest of a frame. Meant for non-blocking sockets driven by a selector: call it when the
+        socket is readable, then take any complete frames with has_frame / recv_frame.
+        Returns False if the connection closed.
+        """
+        self._make_room(self.end - self.start + 1)
+        try:
+            received = self.conn.recv_into(self.view[self.end:])
+        except BlockingIOError:
+            return True  # woken up with nothing to read after all
+        if not received:
+            return False
+        self.end += received
+        return True
+
+    def recv_frame(self):
+        """
+        Read one length-prefixed frame and return it as a memoryview into the receive buffer,
+        so it is verified and decrypted in place without a copy. The view is only valid until
+        the next call, so callers must finish with it (or copy it) before reading again.
+        Returns None if the connection closed, or if the peer announced a frame larger than
+        MAX_FRAME_SIZE, in which case the connection is shut down.
+        """
+        if not self._fill(LENGTH_PREFIX_SIZE):
+            return None
+        (length,) = _LENGTH.unpack_from(self.buf, self.start)
+        if length > MAX_FRAME_SIZE:
+            self._reject()
+            return None
+        if not self._fill(LENGTH_PREFIX_SIZE + length):
+            return None
+        begin = self.start + LENGTH_PREFIX_SIZE
+        self.start = begin + length
+        frame = self.view[begin:self.start]
+        if self.start == self.end:
+            self.start = self.end = 0  # buffer drained, next receive starts at the front
+        return frame
+
+    def _reject(self):
+        # the stream can't be trusted past a bad length, so drop what is buffered and shut the
+        # socket down; its owner then sees the connection as closed on the next read or send
+        self.start = self.end = 0
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        # drops any buffered data; the socket itself is closed by its owner
+        self.start = self.end = 0
+
+
+# A fixed message encrypted once ahead of time, with the CRC of its iv + ciphertext
+PreparedMessage = namedtuple('PreparedMessage', ['body', 'body_crc'])
+
+
+def prepare_message(message):
+    """
+    Encrypt and checksum a constant message once so it can be sent any number of times with
+    only the seq header (and its part of the CRC) filled in per send. The IV is fixed for the
+    prepared copy, which only ever carries this one public string.
+    """
+    body = encrypt_message(message)
+    return PreparedMessage(body, generate_crc32_checksum(body))
+
+
+def _build_frame(seq, message, offset=0):
+    """
+    Encrypt 'message' (str, UTF-8 bytes or a PreparedMessage) and assemble
+    length | seq | iv + ciphertext | crc32 in this thread's send buffer, starting at 'offset'
+    (anything before it is kept). Returns the end of the frame in the buffer; the frame stays
+    valid until the thread builds its next one over it.
+    """
+    start = offset + FRAME_HEADER_SIZE
+    if isinstance(message, PreparedMessage):
+        body, body_crc = message
+        end = start + len(body)
+        view = _send_buffer(end + CRC_SIZE, keep=offset)
+        view[start:end] = body
+    else:
+        # encrypted straight into the buffer and checksummed there while it is still in cache,
+        # rather than built as a separate bytes object and copied in
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        end = start + IV_SIZE + len(message)
+        view = _send_buffer(end + CRC_SIZE, keep=offset)
+        encrypt_into(message, view[start:end])
+        body_crc = generate_crc32_checksum(view[start:end])
+    _FRAME_HEADER.pack_into(view, offset, end - offset - LENGTH_PREFIX_SIZE + CRC_SIZE, seq)
+    header = view[offset + LENGTH_PREFIX_SIZE:start]
+    _CRC.pack_into(view, end, generate_crc32_checksum(header, body_crc))
+    return end + CRC_SIZE
+
+
+def unpack_packet(packet):
+    """
+    Verify and decrypt the packet inside a frame.
+    Returns (seq, plaintext), or None if the packet is truncated, fails its checksum or
+    does not decrypt to valid UTF-8.
+    """
+    if len(packet) < SEQ_SIZE + IV_SIZE + CRC_SIZE:
+        return None
+    view = memoryview(packet)
+    header = view[:SEQ_SIZE]
+    body = view[SEQ_SIZE:-CRC_SIZE]
+    (received_checksum,) = _CRC.unpack(view[-CRC_SIZE:])
+    if generate_crc32_checksum(header, generate_crc32_checksum(body)) != received_checksum:
+        return None
+    (seq,) = _SEQ.unpack(header)
+    try:
+        plaintext = decrypt_message(body)
+    except UnicodeDecodeError:
+        return None
+    return seq, plaintext
+
+
+def frame_packet(seq, message):
+    """
+    Build the complete framed packet for 'message', so the same bytes can be sent to many sockets.
+    """
+    end = _build_frame(seq, message)
+    return bytes(_tls.view[:end])
+
+
+def send_packet(conn, seq, message):
+    """
+    Encrypt 'message' and send it as one packet frame on the socket 'conn'.
+    """
+    end = _build_frame(seq, message)
+    conn.sendall(_tls.view[:end])
+
+
+def send_packets(conn, seq, messages):
+    """
+    Send several messages to 'conn' as consecutive packet frames in one sendall, so a burst
+    (e.g. a prompt followed by a board) leaves in as few segments as possible and wakes the
+    client once.
+    """
+    end = 0
+    for message in messages:
+        end = _build_frame(seq, message, end)  # frames go back to back in the send buffer
+    conn.sendall(_tls.view[:end])
+
+
+def recv_packet(rfile):
+    """
+    Read one packet frame from a FrameReader and return (seq, plaintext).
+    Returns None if the connection closed or the packet was corrupt.
+    """
+    packet = rfile.recv_frame()
+    if packet is None:
+        return None
+    return unpack_packet(packet)
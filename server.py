@@ -1,48 +1,147 @@
 import socket
-from battleship import run_two_player_game_online, send, recv
-from crypto_utils import encrypt_message, decrypt_message
+import selectors
+from battleship import run_two_player_game_online, Selector
+from protocol import send_packet, recv_packet, frame_packet, prepare_message, NO_SEQ, FrameReader
 import threading
 import time
-import zlib
+from collections import deque
 
 
 HOST = '127.0.0.1'
 PORT = 5000
 RECONNECT_TIMEOUT = 60  # 60 seconds for reconnection window
+HANDOVER_TIMEOUT = 5  # seconds a login that claimed a seat gets to hand its connection over
+PLAY_AGAIN_TIMEOUT = 30  # seconds both players get to answer the play-again prompt
 
-lobby = []  # List to hold players waiting for a game
-active_players = {}  # Dictionary to store active players' details (ID, username, still_active)
-game_states = {}
-current_match = {}    # username -> (player1_tuple, player2_tuple)
+# Keepalive probing so a half-open connection is noticed in about a minute, well inside the
+# reconnection window, rather than after the OS default of ~2 hours
+KEEPALIVE_IDLE = 30  # seconds of silence before the first probe
+KEEPALIVE_INTERVAL = 10  # seconds between probes
+KEEPALIVE_COUNT = 3  # unanswered probes before the connection is dropped
+USER_TIMEOUT_MS = 60000  # how long sent data may go unacknowledged
+
+lobby = deque()  # FIFO of players waiting for a game (and spectators)
+lobby_usernames = set()  # usernames currently in the lobby, for O(1) lookups
+sessions = {}  # username -> PlayerSession for every player in (or reconnecting to) a game
 
 lobby_lock = threading.Lock()  # Ensure only one thread accesses the lobby at a time
-game_lock = threading.Lock()  # Ensure only one active game at a time
+state_lock = threading.Lock()  # Guards the sessions dict; only held for lookups and updates, never across I/O
+
+# Fixed messages, encrypted and checksummed once at startup instead of on every send
+WELCOME = prepare_message("[INFO] Welcome! Please enter your username:")
+USERNAME_TAKEN = prepare_message("[ERROR] This username is already taken. Please choose a different one.")
+CHECKING_GAMES = prepare_message("[INFO] Checking for any ongoing games...")
+PREVIOUS_GAME_ENDED = prepare_message("[INFO] Your previous game has already ended. You will return to the lobby.")
+RECONNECTED = prepare_message("[INFO] Reconnected! Waiting for game to resume...")
+IN_LOBBY = prepare_message("[INFO] You are in the lobby")
+PLAY_AGAIN_PROMPT = prepare_message("[INFO] Game over. Do you want to play again? (yes/no)")
+INVALID_SEQ = prepare_message("[ERROR] Invalid or duplicate seq. Exiting game.")
+GAME_ENDED = prepare_message("[INFO] Game ended. Thanks for playing!")
+RETURNING_TO_LOBBY = prepare_message("[INFO] Game ended. Returning to lobby.")
+GOODBYE = prepare_message("[INFO] Goodbye!")
+
+
+class Match:
+    """
+    What the two players of one game share. The saved state lives here once, and both
+    players' sessions point at it, instead of a copy being written into each session.
+    """
+    __slots__ = ('state',)
 
-spectator_threads = {}
+    def __init__(self, state=None):
+        self.state = state  # last saved game state, used to resume after a reconnect
 
-  
-def send_with_checksum(wfile, message, username=None):
+
+class PlayerSession:
+    """
+    Everything the server tracks about one player in a game, kept in one object per username
+    instead of spread across several dicts.
+    """
+    __slots__ = ('still_active', 'reconnected', 'conn_data', 'last_received_seq', 'match')
+
+    def __init__(self, match):
+        self.still_active = True
+        self.reconnected = threading.Event()  # set when the player comes back after a disconnect
+        self.conn_data = None  # (conn, rfile) the player reconnected on, set before 'reconnected'
+        self.last_received_seq = -1
+        self.match = match  # the Match this player is in, shared with the opponent
+
+
+class LobbyEntry:
+    """
+    A client waiting in the lobby. Spectator updates are sent to it outside lobby_lock, so
+    'send_lock' is held around each one, and the game that takes the client sets 'claimed'
+    under that lock before touching the socket. An update in flight is finished first, and
+    none is sent (or input drained) once a game owns the connection.
+    """
+    __slots__ = ('conn', 'rfile', 'username', 'send_lock', 'claimed')
+
+    def __init__(self, conn, rfile, username):
+        self.conn = conn
+        self.rfile = rfile
+        self.username = username
+        self.send_lock = threading.Lock()
+        self.claimed = False  # only read or written while holding send_lock
+
+
+# Lobby mutations go through these so lobby_usernames always matches lobby.
+# Callers hold lobby_lock.
+def _lobby_add(entry):
+    lobby.append(entry)
+    lobby_usernames.add(entry.username)
+
+
+def _lobby_pop():
+    entry = lobby.popleft()
+    lobby_usernames.discard(entry.username)
+    return entry
+
+
+# Callers hold state_lock. A username can move on to a new game while an old one is still
+# winding down, so a game only ever removes its own session, never whatever has that name now.
+def _session_discard(username, session):
+    if sessions.get(username) is session:
+        del sessions[username]
+
+
+def _lobby_discard(entries):
+    # drops all of 'entries' in one pass over the lobby, rather than a scan per entry
+    gone = set(map(id, entries))
+    kept = [entry for entry in lobby if id(entry) not in gone]
+    if len(kept) != len(lobby):
+        lobby.clear()
+        lobby.extend(kept)
+        lobby_usernames.clear()
+        lobby_usernames.update(entry.username for entry in kept)
+
+
+def configure_socket(conn):
+    """
+    Set the per-connection TCP options: no Nagle delay on the small game messages, and
+    keepalive/user timeouts so a dead peer shows up as a socket error quickly.
+    The timing options are Linux-specific and skipped where they don't exist.
+    """
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+                        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+                        ("TCP_USER_TIMEOUT", USER_TIMEOUT_MS)):
+        option = getattr(socket, name, None)
+        if option is not None:
+            conn.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
+def send_with_checksum(conn, message, username=None):
     """
     Send a message with a checksum attached, to the client.
+    'message' is a str, UTF-8 bytes or one of the prepared constant messages above.
     """
-    # encrypt the message (iv+msg)
-    encrypted_message = encrypt_message(message)
-    
     # send an acknowledgement if the message is going to an active player 
-    if username:
-        ack = active_players[username]['last_received_seq']
-        enc_message_with_seq = f"{ack}|{encrypted_message}"
-        checksum = zlib.crc32(encrypted_message.encode())
-        message_with_checksum = f"{enc_message_with_seq}|{checksum}"
-        wfile.write(message_with_checksum + '\n')
-        wfile.flush()
-    else:
-        # else just send encrypted message and checksum with empty header so that it can be unpacked properly in client.p
-        enc_message_with_no_header = f"|{encrypted_message}"
-        checksum = zlib.crc32(encrypted_message.encode())
-        message_with_checksum = f"{enc_message_with_no_header}|{checksum}"        
-        wfile.write(message_with_checksum + '\n')
-        wfile.flush()
+    session = sessions.get(username) if username else None
+    ack = session.last_received_seq if session else NO_SEQ
+    # encrypts the message and sends it as one seq|(iv + ciphertext)|checksum packet
+    send_packet(conn, ack, message)
 
 
 def recv_with_checksum(rfile):
@@ -51,311 +150,427 @@ def recv_with_checksum(rfile):
     
     At this point the message looks like
     seq|(iv + cyphertext)|checksum
+    
+    Returns (seq, plaintext), or None if the client disconnected or the packet was malformed.
     """
-    message_with_checksum = rfile.readline().strip()
+    # Malformed packets are already rejected (as None) by the length, checksum and UTF-8
+    # checks in unpack_packet, so only a failing socket is left to catch here
     try:
-        # extract checksum
-        message_with_seq, received_checksum = message_with_checksum.rsplit('|', 1) 
-        
-        # validate checksum
-        calculated_checksum = zlib.crc32(message_with_seq.encode())  
-        if int(received_checksum) != calculated_checksum: 
-            return None
-        
-        # extract seq num 
-        seq_str, encrypted_data = message_with_seq.split('|',1)
-        seq = int(seq_str) 
-        
-        plaintext = recv_encrypted_data(encrypted_data)
-        return seq, plaintext
-        
-    except:
-        pass  # Silently discard any malformed or invalid messages
-    return None
+        return recv_packet(rfile)
+    except OSError:
+        return None
 
-def recv_encrypted_data(enc_message):
+def is_connected(conn):
     """
-    At this point, the message looks like
-    iv + cyphertext
-    
-    we know the iv is 16 bytes long
+    Check whether the peer on 'conn' is still there without writing anything to it.
+    A pending socket error, a reset or an orderly shutdown (an empty peek) all count as gone.
     """
-    plaintext = decrypt_message(enc_message)
-    return plaintext
+    if conn.fileno() == -1:
+        return False
+    if conn.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+        return False
+    try:
+        with Selector() as sel:
+            sel.register(conn, selectors.EVENT_READ)
+            if not sel.select(0):
+                return True  # nothing to read, but the connection is open
+        # readable, so the peek returns at once: data, or b"" if the peer has shut down
+        return conn.recv(1, socket.MSG_PEEK) != b""
+    except OSError:
+        return False
+
+def recv_replies(*rfiles, timeout):
+    """
+    Read one message from each of 'rfiles', handling them in whichever order they arrive
+    rather than waiting on each in turn.
+    Returns the (seq, plaintext) replies in the order of 'rfiles', with None for any that
+    didn't arrive within 'timeout' seconds or were malformed.
+    """
+    replies = {}
+    deadline = time.monotonic() + timeout
+    with Selector() as sel:
+        for rfile in rfiles:
+            if rfile.has_frame():
+                replies[rfile] = recv_with_checksum(rfile)  # already buffered
+            else:
+                sel.register(rfile, selectors.EVENT_READ)
+        while len(replies) < len(rfiles):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in sel.select(remaining):
+                sel.unregister(key.fileobj)
+                replies[key.fileobj] = recv_with_checksum(key.fileobj)
+    return [replies.get(rfile) for rfile in rfiles]
 
 def save_game_state(p1, p2, game_data):
     """Called by battleship after each turn to persist state."""
-    game_states[p1] = game_data
-    game_states[p2] = game_data
+    session = sessions.get(p1)
+    if session:
+        session.match.state = game_data  # p2's session shares the same Match
 
 
 def handle_clients(player1, player2):
     """
     Handles the game between two connected players.
-    Ends the game if a client disconnects.
+    If a client disconnects the game waits for them to reconnect and resumes in the same loop;
+    it ends if they don't come back in time.
     """
     print("[INFO] LET'S PLAY!")
 
-    with game_lock:  # aquire lock to ensure one game at a time
-        conn1, rfile1, wfile1, username1 = player1
-        conn2, rfile2, wfile2, username2 = player2
-        
-        did_resume = False
-
-        current_match[username1] = (player1, player2)
-        current_match[username2] = (player1, player2)
-
-        active_players[username1] = {'still_active': True, 'disconnect_time': None, 'last_received_seq': -1}
-        active_players[username2] = {'still_active': True, 'disconnect_time': None, 'last_received_seq': -1}
-        
-        initial_state = game_states.get(username1)
-      
+    for entry in (player1, player2):
+        with entry.send_lock:  # waits out a spectator update still being sent to it
+            entry.claimed = True
+    player1 = (player1.conn, player1.rfile, player1.username)
+    player2 = (player2.conn, player2.rfile, player2.username)
+    conn1, rfile1, username1 = player1
+    conn2, rfile2, username2 = player2
+
+    # the announcement is the same for both players, so it is encrypted once
+    announcement = frame_packet(NO_SEQ, f"[INFO] {username1} and {username2} will be playing the next game!")
+    for conn in (conn1, conn2):
         try:
-            while True:
-                run_two_player_game_online((rfile1, wfile1), (rfile2, wfile2), broadcast_to_spectators, save_game_state,
-                username1, username2, initial_state=initial_state)
-
-                send_with_checksum(wfile1, "[INFO] Game over. Do you want to play again? (yes/no)", username1)
-                send_with_checksum(wfile2, "[INFO] Game over. Do you want to play again? (yes/no)", username2)
-
-                seq1, response1 = recv_with_checksum(rfile1)
-                seq2, response2 = recv_with_checksum(rfile2)
-                
-                response1 = response1.strip().lower()
-                response2 = response2.strip().lower() 
-                                
-                if seq1 is None or seq1 <= active_players[username1]['last_received_seq']:
-                    print(f"[WARNING] Invalid or duplicate seq from {username1}: {seq1}")
-                    send_with_checksum(wfile1, "[ERROR] Invalid or duplicate seq. Exiting game.", username1)
-                    game_states.pop(username1, None)
-                    game_states.pop(username2, None)
-                    continue 
-
-                if seq2 is None or seq2 <= active_players[username2]['last_received_seq']:
-                    print(f"[WARNING] Invalid or duplicate seq from {username2}: {seq2}")
-                    send_with_checksum(wfile2, "[ERROR] Invalid or duplicate seq. Exiting game.", username2)
-                    game_states.pop(username1, None)
-                    game_states.pop(username2, None)
-                    continue
-
-                active_players[username1]['last_received_seq'] = seq1
-                active_players[username2]['last_received_seq'] = seq2                      
-                
-                if response1 == "yes" and response2 == "yes":
-                    send_with_checksum(wfile1, "[INFO] Game ended. Thanks for playing!", username1)
-                    send_with_checksum(wfile2, "[INFO] Game ended. Thanks for playing!", username2)
-                    game_states.pop(username1, None)
-                    game_states.pop(username2, None)
-                    continue
-                else:
-                    send_with_checksum(wfile1, "[INFO] Game ended. Returning to lobby." if response1 == "yes" else "[INFO] Goodbye!", username1)
-                    send_with_checksum(wfile2, "[INFO] Game ended. Returning to lobby." if response2 == "yes" else "[INFO] Goodbye!", username2)
-
-                    # Re-add players who want to play again to the lobby
-                    with lobby_lock:
-                        if response1 == "yes":
-                            lobby.append(player1)
-                        if response2 == "yes":
-                            lobby.append(player2)
-                    break
+            conn.sendall(announcement)
+        except OSError:
+            pass  # the dropped player is found and handled once the game starts
+
+    response1 = response2 = None
+
+    # A new pairing always starts from fresh boards; saved state is only ever resumed by this
+    # thread, for this match, after one of its own players reconnects
+    initial_state = None
+    with state_lock:
+        match = Match()
+        session1 = sessions[username1] = PlayerSession(match)
+        session2 = sessions[username2] = PlayerSession(match)
+
+    spectator_tag = f"[SPECTATOR] {username1} vs {username2} - game state update:\n".encode('utf-8')
+    broadcast = lambda game_state: broadcast_to_spectators(spectator_tag, game_state)
+  
+    while True:
+        try:
+            run_two_player_game_online((rfile1, conn1), (rfile2, conn2), broadcast, save_game_state,
+            username1, username2, initial_state=initial_state)
+            initial_state = None  # any further game starts from scratch
+
+            send_with_checksum(conn1, PLAY_AGAIN_PROMPT, username1)
+            send_with_checksum(conn2, PLAY_AGAIN_PROMPT, username2)
+
+            # a reply that doesn't come (timeout, disconnect or corrupt packet) counts as "no"
+            reply1, reply2 = recv_replies(rfile1, rfile2, timeout=PLAY_AGAIN_TIMEOUT)
+            seq1, response1 = reply1 or (None, "no")
+            seq2, response2 = reply2 or (None, "no")
+            
+            response1 = response1.strip().lower()
+            response2 = response2.strip().lower() 
+                            
+            if seq1 is not None and seq1 <= session1.last_received_seq:
+                print(f"[WARNING] Invalid or duplicate seq from {username1}: {seq1}")
+                send_with_checksum(conn1, INVALID_SEQ, username1)
+                match.state = None
+                continue 
+
+            if seq2 is not None and seq2 <= session2.last_received_seq:
+                print(f"[WARNING] Invalid or duplicate seq from {username2}: {seq2}")
+                send_with_checksum(conn2, INVALID_SEQ, username2)
+                match.state = None
+                continue
+
+            if seq1 is not None:
+                session1.last_received_seq = seq1
+            if seq2 is not None:
+                session2.last_received_seq = seq2                      
+            
+            if response1 == "yes" and response2 == "yes":
+                send_with_checksum(conn1, GAME_ENDED, username1)
+                send_with_checksum(conn2, GAME_ENDED, username2)
+                match.state = None
+                continue
+            else:
+                send_with_checksum(conn1, RETURNING_TO_LOBBY if response1 == "yes" else GOODBYE, username1)
+                send_with_checksum(conn2, RETURNING_TO_LOBBY if response2 == "yes" else GOODBYE, username2)
+                match.state = None  # this match is over; nothing left to resume
+
+                # Re-add players who want to play again to the lobby
+                with lobby_lock:
+                    # fresh entries, so a broadcast still holding the old ones stays away
+                    if response1 == "yes":
+                        _lobby_add(LobbyEntry(*player1))
+                    if response2 == "yes":
+                        _lobby_add(LobbyEntry(*player2))
+                break
 
         except (KeyboardInterrupt, ConnectionResetError, BrokenPipeError, OSError):
             print("[WARNING] A player disconnected unexpectedly. Handling disconnection...")
-            disconnected, opponent = None, None
+            response1 = response2 = None
 
-            try:
-                send_with_checksum(wfile1, "[PING]", username1)
-                player1_connected = True
-            except:
-                player1_connected = False
+            # work out who dropped from the socket state rather than by probing with a write
+            if not is_connected(conn1):
+                disconnected, opponent = username1, (conn2, rfile2, username2)
+            else:
+                disconnected, opponent = username2, (conn1, rfile1, username1)
+
+            session = session1 if disconnected == username1 else session2
+            with state_lock:
+                session.reconnected.clear()  # cleared first so a reconnect can't be wiped out
+                session.still_active = False
+
+            # Block until lobby_manager signals the reconnect (or the window closes) instead of polling
+            reconnected = session.reconnected.wait(timeout=RECONNECT_TIMEOUT)
+            if not reconnected:
+                if session.still_active:
+                    # a login claimed the seat just as the window closed; give its handover a
+                    # bounded moment to land
+                    session.reconnected.wait(timeout=HANDOVER_TIMEOUT)
+                with state_lock:
+                    # decided under the lock, so a handover either lands before this or finds
+                    # the session gone and sends its player to the lobby instead
+                    reconnected = session.reconnected.is_set()
+                    if not reconnected:
+                        _session_discard(disconnected, session)
+
+            if not reconnected:
+                print(f"[INFO] {disconnected} failed to reconnect. {opponent[2]} wins by default.")
+                try:
+                    send_with_checksum(opponent[0], f"[INFO] {disconnected} failed to reconnect in time. You win!")
+                except OSError:
+                    pass
+                break
 
+            print(f"[INFO] {disconnected} has reconnected. Resuming game.")
+            # Swap in the connection the player came back on; seats and boards stay the same,
+            # and the next pass of the loop resumes from the saved state
+            if disconnected == username1:
+                conn1.close()
+                conn1, rfile1 = session.conn_data
+                player1 = (conn1, rfile1, username1)
+            else:
+                conn2.close()
+                conn2, rfile2 = session.conn_data
+                player2 = (conn2, rfile2, username2)
+            initial_state = match.state
+
+    for player, response, session in ((player1, response1, session1), (player2, response2, session2)):
+        conn, rfile, username = player
+        if response != "yes":
+            if rfile:
+                try: rfile.close()
+                except: pass
             try:
-                send_with_checksum(wfile2, "[PING]", username2)
-                player2_connected = True
+                conn.close()
             except:
-                player2_connected = False
-
-            if not player1_connected:
-                disconnected, opponent = username1, (conn2, rfile2, wfile2, username2)
-            else:
-                disconnected, opponent = username2, (conn1, rfile1, wfile1, username1)
-
-            active_players[disconnected]['still_active'] = False
-            active_players[disconnected]['disconnect_time'] = time.time()
-
-            for _ in range(RECONNECT_TIMEOUT):
-                time.sleep(1)
-                if active_players[disconnected]['still_active']:
-                    print(f"[INFO] {disconnected} has reconnected. Resuming game.")
-                    did_resume = True
-                    re_p1, re_p2 = current_match[disconnected]
-                    # Determine which I/O tuple belongs to reconnecting player
-                    if re_p1[3] == disconnected:
-                        player1, player2 = (rfile1, wfile1), (rfile2, wfile2)
-                    else:
-                        player1, player2 = (rfile2, wfile2), (rfile1, wfile1)
-
-                    run_two_player_game_online(player1, player2, broadcast_to_spectators, save_game_state, 
-                                               username1, username2,
-                                               initial_state=game_states.get(disconnected))
-                    break
-
-            print(f"[INFO] {disconnected} failed to reconnect. {opponent[3]} wins by default.")
-            send_with_checksum(opponent[2], f"[INFO] {disconnected} failed to reconnect in time. You win!")
-
-        finally:
-            if not did_resume:
-                responses = {username1: response1, username2: response2}
-                for player in [player1, player2]:
-                    conn, rfile, wfile, username = player
-                    if responses.get(username) != "yes":
-                        if rfile:
-                            try: rfile.close()
-                            except: pass
-                        if wfile:
-                            try: wfile.close()
-                            except: pass
-                        try:
-                            conn.close()
-                        except:
-                            pass
-                        active_players.pop(username, None)
-                        game_states.pop(username, None)
+                pass
+            with state_lock:
+                _session_discard(username, session)
 
     launch_game_if_ready()
 
 
-def broadcast_to_spectators(game_state):
+def broadcast_to_spectators(match_tag, game_state):
     """
-    Sends the current game state to all connected spectators.
+    Sends the current game state (already encoded bytes) to everyone waiting in the lobby.
+    Several games run at once, so each update is prefixed with 'match_tag' naming its game.
+    The packet is encrypted and checksummed once and the same bytes go to every spectator.
+    No I/O happens under lobby_lock: it is only held to copy the lobby and to drop dead
+    spectators afterwards, so a spectator that stops reading never holds up logins, game
+    launches or the other games. Each send happens under the entry's own send_lock and is
+    skipped once a game has claimed the entry, so a client taken into a game meanwhile never
+    gets another game's update or has its moves drained.
     """
     with lobby_lock:
-        for entry in list(lobby):
-            conn, rfile, wfile, user = entry
+        spectators = list(lobby)
+    if not spectators:
+        return  # nobody watching, so nothing to encrypt
+
+    packet = frame_packet(NO_SEQ, match_tag + game_state)
+
+    dead = []
+    for entry in spectators:
+        with entry.send_lock:
+            if entry.claimed:
+                continue
             try:
-                send_with_checksum(wfile, f"[SPECTATOR] Game state update:\n{game_state}")
-            except:
-                lobby.remove(entry)
+                entry.conn.sendall(packet)
+                if not drain_input(entry.rfile):
+                    dead.append(entry)
+            except OSError:
+                dead.append(entry)
 
+    if dead:
+        with lobby_lock:
+            _lobby_discard(dead)  # entries already taken into a game meanwhile are left alone
 
-def handle_spectator_input(rfile, wfile, stop_event):
+
+def drain_input(rfile):
     """
-    Handles input from spectators. Any input is ignored or produces an error message.
+    Discard whatever a waiting client has sent, without blocking, so it isn't read later as
+    a move. Goes through the client's FrameReader a whole frame at a time, so a partly received
+    frame stays buffered for whoever reads next. Only call it under the lobby entry's send_lock,
+    while no game has claimed it.
+    Returns False if the client has closed the connection.
     """
-    try:
-        send_with_checksum(wfile, "[SPECTATOR] You are in the lobby. Waiting for your turn...\n")
-        while not stop_event.is_set():  # Stop when the event is set
-            time.sleep(1)
-    except Exception as e:
-        print(f"[ERROR] Spectator input error: {e}")
+    with Selector() as sel:
+        sel.register(rfile, selectors.EVENT_READ)
+        while True:
+            while rfile.has_frame():
+                if rfile.recv_frame() is None:
+                    return False  # oversized frame, the reader has dropped the connection
+            if not sel.select(0):
+                return True
+            if not rfile.feed():
+                return False
 
 
-def stop_spectator_thread(username):
-    """
-    Signals the spectator thread to stop so it doesn't continue processing input.
-    """
-    if username in spectator_threads:
-        spectator_threads[username].set()  # Signal to stop the spectator thread
-        spectator_threads.pop(username)
+def prompt_username(conn):
+    send_with_checksum(conn, WELCOME)
 
 
-def lobby_manager(conn, addr):
+def handle_login(conn, rfile):
     """
-    Manages lobby for players waiting to join a game. 
+    Handles one username attempt from a connecting client, called from the accept loop when
+    the client's socket is readable.
+    Returns True once the client no longer needs the accept loop (logged in, or gone).
     """
-    print(f"[INFO] New client connected from {addr}")
-    rfile = conn.makefile('r')
-    wfile = conn.makefile('w')
+    packet = recv_with_checksum(rfile)
+    if packet is None:
+        conn.close()
+        return True
+    seq, username = packet
+    
+    username = username.strip().lower()
 
-    while True:
-        send_with_checksum(wfile, "[INFO] Welcome! Please enter your username:")
+    username_taken_in_lobby = username in lobby_usernames
+    # a name held by a player in a game is only free to the player reconnecting to that seat;
+    # this is one lookup on that player's session rather than a scan of every session
+    with state_lock:
+        session = sessions.get(username)
+        username_in_active_game = session is not None and session.still_active
 
-        seq, username = recv_with_checksum(rfile)
-        
-        username = username.strip().lower()
+    if username_taken_in_lobby or username_in_active_game:
+        send_with_checksum(conn, USERNAME_TAKEN)
+        prompt_username(conn)
+        return False
 
-        username_taken_in_lobby = any(username == entry[3] for entry in lobby)
-        username_in_active_players = username in active_players
-        all_players_still_active = all(info['still_active'] for info in active_players.values())
+    lobby_manager(conn, rfile, username)
+    return True
 
-        if username_taken_in_lobby or (username_in_active_players and all_players_still_active):
-            send_with_checksum(wfile, "[ERROR] This username is already taken. Please choose a different one.")
-        else:
-            break
 
+def lobby_manager(conn, rfile, username):
+    """
+    Manages lobby for players waiting to join a game. 
+    """
     # Handle reconnecting players
-    send_with_checksum(wfile, "[INFO] Checking for any ongoing games...")
-    if username in active_players and not active_players[username]['still_active'] and game_lock.locked():
-        if username not in game_states:
-            send_with_checksum(wfile, "[INFO] Your previous game has already ended. You will return to the lobby.")
+    send_with_checksum(conn, CHECKING_GAMES)
+    # Session lookups and the seat claim go through state_lock, not lobby_lock, so a
+    # reconnect never waits on lobby traffic
+    with state_lock:
+        session = sessions.get(username)
+        resuming = session is not None and not session.still_active
+        if resuming and session.match.state is not None:
+            session.still_active = True  # claim the seat before anyone else can
+    if resuming:
+        if session.match.state is None:
+            send_with_checksum(conn, PREVIOUS_GAME_ENDED)
         
         else:
             print(f"[INFO] {username} attempting to reconnect...")
-            active_players[username]['still_active'] = True
-            p1, p2 = current_match[username]
-
-            # determine which tuple is theirs
-            if p1[3] == username:
-                resume_self, resume_opp = (conn, rfile, wfile, username), p2
-            else:
-                resume_self, resume_opp = (conn, rfile, wfile, username), p1
-
-            send_with_checksum(wfile, "[INFO] Reconnected! Waiting for game to resume...")
-            threading.Thread(target=run_two_player_game_online,
-                args=((resume_self[1], resume_self[2]), (resume_opp[1], resume_opp[2]),
-                    broadcast_to_spectators,
-                    save_game_state,
-                    p1[3], p2[3]
-                ),
-                kwargs={'initial_state': game_states.get(username)},
-                daemon=True
-            ).start()
-            return
+            try:
+                send_with_checksum(conn, RECONNECTED)
+            except OSError:
+                with state_lock:
+                    session.still_active = False  # give the seat back for another attempt
+                raise
+            # Hand the new connection to the handle_clients thread waiting on this session,
+            # which resumes the game on it; checked under the lock in case the window closed
+            with state_lock:
+                handed_over = sessions.get(username) is session
+                if handed_over:
+                    conn.setblocking(True)  # game threads use blocking sockets
+                    session.conn_data = (conn, rfile)
+                    session.reconnected.set()
+            if handed_over:
+                return
+            send_with_checksum(conn, PREVIOUS_GAME_ENDED)
         
    
-    with lobby_lock: 
-        if len(lobby) < 2 and not game_lock.locked():
-            send_with_checksum(wfile, "[INFO] You are in the lobby")
-            lobby.append((conn, rfile, wfile, username))
-        else:
-            send_with_checksum(wfile, "[INFO] Game is full. You are now a spectator.")
-            stop_event = threading.Event()
-            spectator_threads[username] = stop_event
-            lobby.append((conn, rfile, wfile, username))
-            threading.Thread(target=handle_spectator_input, args=(rfile, wfile, stop_event), daemon=True).start()
+    # Pairs are taken out of the lobby as soon as they form, so a new client always waits for
+    # an opponent here; meanwhile it watches the games in progress via broadcast_to_spectators.
+    # No I/O happens under lobby_lock: the welcome is sent before the client joins the lobby
+    send_with_checksum(conn, IN_LOBBY)
+    conn.setblocking(True)  # lobby and game threads use blocking sockets
+    with lobby_lock:
+        _lobby_add(LobbyEntry(conn, rfile, username))
     launch_game_if_ready()
 
 
 def launch_game_if_ready():
+    # Every waiting pair gets its own game thread; games run side by side.
+    # The pairs are taken under lobby_lock; all I/O with them happens on their game thread,
+    # so this never blocks the accept loop that calls it.
     with lobby_lock:
-        if len(lobby) >= 2 and not game_lock.locked():
-            player1 = lobby.pop(0)
-            player2 = lobby.pop(0)
-
-            for entry in [player1, player2]:
-                conn, rfile, wfile, user = entry
-                send_with_checksum(wfile, f"[INFO] {player1[3]} and {player2[3]} will be playing the next game!")
-
-            stop_spectator_thread(player1[3])
-            stop_spectator_thread(player2[3])
+        pairs = []
+        while len(lobby) >= 2:
+            pairs.append((_lobby_pop(), _lobby_pop()))
 
-            threading.Thread(target=handle_clients, args=(player1, player2), daemon=True).start()
+    for player1, player2 in pairs:
+        threading.Thread(target=handle_clients, args=(player1, player2), daemon=True).start()
 
 
 def main():
     """
     Continuously accepts clients and assigns them into games.
+
+    New connections and their username logins are all handled by this one thread through a
+    selector, instead of a thread per connection. Login sockets are non-blocking and frames
+    are put together from whatever has arrived, so a slow or stalled client never holds up
+    the others. Once a client is logged in its socket is made blocking again, handed over to
+    the lobby / game threads and unregistered here.
     """
     print(f"[INFO] Server listening on {HOST}:{PORT}")
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s, Selector() as sel:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind((HOST, PORT))
         s.listen() # continuously listen for new connections (rm backlog=2)
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ) # data None marks the listening socket
 
         while True:
             try:
-                conn, addr = s.accept()
-                threading.Thread(target=lobby_manager, args=(conn, addr), daemon=True).start()
+                for key, _ in sel.select():
+                    if key.data is None:
+                        try:
+                            conn, addr = s.accept()
+                        except OSError:
+                            continue  # the client gave up before it was accepted
+                        try:
+                            # stays non-blocking until login is done, so no client can stall this loop
+                            conn.setblocking(False)
+                            configure_socket(conn)
+                            print(f"[INFO] New client connected from {addr}")
+                            rfile = FrameReader(conn) # frames are read with recv_into, sends go straight to conn.sendall
+                            prompt_username(conn)
+                        except Exception as e:
+                            print(f"[WARNING] Dropping client {addr}: {e}")
+                            conn.close()
+                            continue
+                        sel.register(conn, selectors.EVENT_READ, rfile)
+                        continue
+
+                    conn, rfile = key.fileobj, key.data
+                    try:
+                        # take only what has arrived; a login is handled once its whole frame is in
+                        done = not rfile.feed()
+                        if done:
+                            conn.close()
+                        while not done and rfile.has_frame():
+                            done = handle_login(conn, rfile)
+                    except Exception as e:
+                        # whatever goes wrong with one client only closes that client's socket
+                        print(f"[WARNING] Dropping client during login: {e}")
+                        conn.close()
+                        done = True
+                    if done:
+                        sel.unregister(conn)
             except KeyboardInterrupt:
                 print("\n[INFO] Server shutting down.")
                 break